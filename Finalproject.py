@@ -1,52 +1,159 @@
 
 # ---------- IMPORTS ----------
+import os
+import tempfile
+import threading
+import warnings
+
 import pandas as pd
 import numpy as np
 import streamlit as st
 import pydeck as pdk
 import matplotlib.pyplot as plt
 
+try:
+    import numba
+except ImportError:  # optional, only used for very large selections
+    numba = None
+
 
 # ---------------------------------------------------------
 # Data loading / cleaning
 # ---------------------------------------------------------
 
+DATA_FILE = "ShipwreckDatabase (1).xlsx"
+
+# Above this many points the map gets slow, so draw a random sample instead
+MAX_MAP_POINTS = 20_000
+
+# From this many matching rows up, count wrecks with the numba kernel
+NUMBA_MIN_ROWS = 1_000_000
+
+# Spreadsheet columns the app uses, mapped to simple names
+COLUMN_NAMES = {
+    "VESSEL TYPE": "Type",
+    "CAUSE OF LOSS": "Cause",
+    "YEAR": "Year",
+    "LIVES LOST": "LivesLost",
+    "SHIP'S NAME": "ShipName",
+    "LATITUDE": "Latitude",
+    "LONGITUDE": "Longitude",
+}
+
+
+def read_sheet(xlsx_path, nrows=None):
+
+    # Only parse the columns the app uses; openpyxl's per-cell work is slow
+    return pd.read_excel(
+        xlsx_path,
+        nrows=nrows,
+        usecols=list(COLUMN_NAMES),
+        dtype={
+            "VESSEL TYPE": "string",
+            "CAUSE OF LOSS": "string",
+            "SHIP'S NAME": "string",
+        },
+    )
+
+
+def convert_to_parquet(xlsx_path, pq_path):
+
+    # One-time import: the app itself only reads the Parquet file
+    df = read_sheet(xlsx_path)
+
+    # Columns mixing text and numbers must have one type for Parquet
+    for col in df.select_dtypes(include="object").columns:
+        df[col] = df[col].astype("string")
+
+    # Write to a temp file in the same folder and swap it in, so an
+    # interrupted write never leaves a truncated file newer than the Excel one
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(pq_path)), suffix=".tmp.parquet"
+        )
+        os.close(fd)
+        df.to_parquet(tmp_path, engine="pyarrow", compression="zstd")
+        os.replace(tmp_path, pq_path)
+    except OSError as err:
+        # read-only folder or full disk: use the parsed data without a copy
+        warnings.warn(
+            f"Could not write {pq_path} ({err}); the Excel file will be "
+            f"parsed again on the next start"
+        )
+    finally:
+        # only still there if the write or the swap failed
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return df
+
+
 # #[FUNC2P]  function with 2+ params, one has a default value
-def load_data(filename="ShipwreckDatabase (1).xlsx", nrows=None):
+# cache_resource hands every rerun and session the same DataFrame instead of
+# unpickling a copy; the app only reads from it, so sharing is safe
+@st.cache_resource(show_spinner=False)
+def load_data(filename=DATA_FILE, nrows=None):
+
+    # Parsing the Excel file is slow, so read the Parquet copy next to it
+    # and only go back to the spreadsheet when it has changed
+    parquet_file = os.path.splitext(filename)[0] + ".parquet"
+    if (
+        os.path.exists(parquet_file)
+        and os.path.getmtime(parquet_file) >= os.path.getmtime(filename)
+    ):
+        df = pd.read_parquet(
+            parquet_file, engine="pyarrow", columns=list(COLUMN_NAMES)
+        )
+    else:
+        df = convert_to_parquet(filename, parquet_file)
 
-    df = pd.read_excel(filename, nrows=nrows)
+    if nrows is not None:
+        df = df.head(nrows)
 
     # Rename long column names to simple ones
-    df = df.rename(
-        columns={
-            "VESSEL TYPE": "Type",
-            "CAUSE OF LOSS": "Cause",
-            "YEAR": "Year",
-            "LIVES LOST": "LivesLost",
-            "SHIP'S NAME": "ShipName",
-            "LATITUDE": "Latitude",
-            "LONGITUDE": "Longitude",
-        }
-    )
+    df = df.rename(columns=COLUMN_NAMES)
 
     # Clean numeric fields
     df["Year"] = pd.to_numeric(df["Year"], errors="coerce")
-    df = df.dropna(subset=["Year"])
-    df["Year"] = df["Year"].astype(int)
+    # drop missing years and ones int16 can't hold (astype would wrap them
+    # around silently); between is False for missing values
+    df = df[df["Year"].between(0, np.iinfo(np.int16).max)]
+    df["Year"] = df["Year"].astype(np.int16)
 
-    # #[LISTCOMP]  list comprehension to clean Type strings
-    df["Type"] = [t.strip() if isinstance(t, str) else t for t in df["Type"]]
+    # Clean Type strings (vectorized, missing values are left alone)
+    df["Type"] = df["Type"].astype("string").str.strip()
 
-    df["LivesLost"] = pd.to_numeric(df["LivesLost"], errors="coerce").fillna(0).astype(int)
+    # Few distinct values, so store them as categories: isin/groupby/unique
+    # then work on small integer codes instead of strings
+    df["Type"] = df["Type"].astype("category")
+    df["Cause"] = df["Cause"].astype("category")
+
+    df["LivesLost"] = (
+        pd.to_numeric(df["LivesLost"], errors="coerce").fillna(0).astype(np.int32)
+    )
 
     # Convert Latitude/Longitude to numeric — drop messy values
-    df["Latitude"] = pd.to_numeric(df["Latitude"], errors="coerce")
-    df["Longitude"] = pd.to_numeric(df["Longitude"], errors="coerce")
+    # (float32 is still well under a metre of precision for the map)
+    df["Latitude"] = pd.to_numeric(df["Latitude"], errors="coerce").astype(np.float32)
+    df["Longitude"] = pd.to_numeric(df["Longitude"], errors="coerce").astype(np.float32)
+
+    # Rows the map can show: both coordinates present and in range
+    # (between is False for missing values)
+    valid_lat = df["Latitude"].between(-90, 90)
+    df["ValidCoord"] = valid_lat & df["Longitude"].between(-180, 180)
 
     # #[COLUMNS]  Add a new Fatal column to the DataFrame
-    df["Fatal"] = df["LivesLost"] > 0
+    # stored as 0/1 int8 so counts are a plain sum
+    df["Fatal"] = (df["LivesLost"].to_numpy() > 0).astype(np.int8)
 
-    return df
+    # Keep rows in Year order so year ranges can be found by binary search
+    df = df.sort_values("Year", kind="mergesort").reset_index(drop=True)
+
+    # Vessel types for the sidebar, worked out once and cached with the data
+    type_options = tuple(df["Type"].cat.categories)
+
+    return df, type_options
 
 
 # #[FUNCRETURN2]  function returns two or more values
@@ -55,16 +162,76 @@ def filter_data(df, year_range, ship_types=None, fatal_only=False):
     start_year, end_year = year_range
 
     # #[FILTER1]  filter by one condition (year range)
-    filtered = df[(df["Year"] >= start_year) & (df["Year"] <= end_year)]
+    # df is sorted by Year (see load_data), so the range is one slice
+    lo = df["Year"].searchsorted(start_year, side="left")
+    hi = df["Year"].searchsorted(end_year, side="right")
 
     # #[FILTER2]  filter by two or more conditions (year AND type AND fatal flag)
+    # one mask over the slice; only the matching row positions are returned,
+    # callers take just the columns they need from df with them
+    mask = np.ones(hi - lo, dtype=bool)
     if ship_types and len(ship_types) > 0:
-        filtered = filtered[filtered["Type"].isin(ship_types)]
+        mask &= df["Type"].iloc[lo:hi].isin(ship_types).to_numpy()
 
     if fatal_only:
-        filtered = filtered[filtered["Fatal"] == True]
+        mask &= df["Fatal"].to_numpy()[lo:hi].astype(bool)
+
+    idx = lo + np.flatnonzero(mask)
+    return idx, len(idx)
+
+
+if numba is not None:
+
+    # One pass over the matching rows fills all three tallies. Not parallel:
+    # prange threads would race on the shared bins
+    @numba.njit(cache=True)
+    def _count_kernel(year_idx, cause_idx, fatal, n_years, n_causes):
+        per_year = np.zeros(n_years, np.int64)
+        per_cause = np.zeros(n_causes, np.int64)
+        per_fatal = np.zeros(2, np.int64)
+        for i in range(year_idx.shape[0]):
+            per_year[year_idx[i]] += 1
+            if cause_idx[i] >= 0:  # code -1 is a missing cause
+                per_cause[cause_idx[i]] += 1
+            per_fatal[fatal[i]] += 1
+        return per_year, per_cause, per_fatal
+
+
+def count_wrecks(df, idx, min_year):
+
+    # count records per year: slot i of the bincount is year min_year + i
+    year_idx = df["Year"].to_numpy()[idx] - min_year
+    causes = df["Cause"].cat.categories
+
+    if numba is not None and len(idx) >= NUMBA_MIN_ROWS:
+        per_year, per_cause, per_fatal = _count_kernel(
+            year_idx,
+            df["Cause"].cat.codes.to_numpy()[idx],
+            df["Fatal"].to_numpy()[idx],
+            int(df["Year"].max()) - min_year + 1,
+            len(causes),
+        )
+        # same order as value_counts: by count, ties in category order
+        cause_counts = pd.Series(per_cause, index=causes).sort_values(
+            ascending=False, kind="stable"
+        )
+        return per_year, cause_counts, int(per_fatal[1])
+
+    return (
+        np.bincount(year_idx),
+        df["Cause"].iloc[idx].value_counts(),
+        int(df["Fatal"].to_numpy()[idx].sum()),
+    )
+
+
+# Reuse one matplotlib figure per chart instead of building a new one on
+# every rerun; cache_resource shares it between sessions, hence the lock
+@st.cache_resource
+def _get_fig(kind):
+    fig, ax = plt.subplots()
+    return fig, ax, threading.Lock()
+
 
-    return filtered, len(filtered)
 # ===========================
 # MAIN STREAMLIT APP
 # ===========================
@@ -77,7 +244,7 @@ def main():
     st.write("Explore shipwrecks by year, vessel type, cause, and severity.")
 
     # Load data
-    df = load_data()
+    df, vessel_type_options = load_data(DATA_FILE)
 
     # ------------- SIDEBAR FILTERS -------------
     st.sidebar.title("Filters")
@@ -93,7 +260,6 @@ def main():
     )
 
     # #[ST1]  multiselect widget for vessel types (dropdown style)
-    vessel_type_options = sorted(df["Type"].dropna().unique().tolist())
     selected_types = st.sidebar.multiselect(
         "Select Vessel Type(s)",
         options=vessel_type_options,
@@ -104,10 +270,16 @@ def main():
     fatal_only = st.sidebar.checkbox("Show only fatal wrecks")
 
     # ------------- FILTER DATA -------------
-    filtered_df, match_count = filter_data(
+    idx, match_count = filter_data(
         df, year_range, ship_types=selected_types, fatal_only=fatal_only
     )
 
+    # The numbers behind each section, read from df at the matching rows
+    year_counts, cause_counts, fatal_total = count_wrecks(df, idx, min_year)
+    lives_total = int(df["LivesLost"].to_numpy()[idx].sum())
+    map_idx = idx[df["ValidCoord"].to_numpy()[idx]]
+    map_df = df[["Latitude", "Longitude"]].iloc[map_idx]
+
     st.subheader("Summary of Matching Shipwrecks")
     st.write(f"Total matching wrecks: **{match_count}**")
 
@@ -115,8 +287,8 @@ def main():
     # #[DICTMETHOD] using .items() on dictionary
     summary_stats = {
         "Total wrecks": match_count,
-        "Fatal wrecks": int(filtered_df["Fatal"].sum()) if not filtered_df.empty else 0,
-        "Total lives lost": int(filtered_df["LivesLost"].sum()) if not filtered_df.empty else 0,
+        "Fatal wrecks": fatal_total,
+        "Total lives lost": lives_total,
     }
 
     # #[ITERLOOP]  loop through items in a dictionary
@@ -130,14 +302,12 @@ def main():
     # ===========================
     st.subheader("Wrecks per Year")
 
-    if filtered_df.empty:
+    if match_count == 0:
         st.write("No data for selected filters.")
     else:
-        # groupby year and count records
-        wrecks_per_year = (
-            filtered_df.groupby("Year")
-            .size()
-            .reset_index(name="Count")
+        wreck_years = np.flatnonzero(year_counts)
+        wrecks_per_year = pd.DataFrame(
+            {"Year": wreck_years + min_year, "Count": year_counts[wreck_years]}
         )
 
         # #[SORT]  sort by Year
@@ -151,13 +321,12 @@ def main():
         )
 
         # #[CHART1]  bar chart showing wrecks per year
-        fig1, ax1 = plt.subplots()
-        ax1.bar(wrecks_per_year["Year"], wrecks_per_year["Count"])
-        ax1.set_title("Number of Wrecks per Year")
-        ax1.set_xlabel("Year")
-        ax1.set_ylabel("Number of Wrecks")
-        plt.setp(ax1.get_xticklabels(), rotation=45, ha="right")
-        st.pyplot(fig1)
+        # (drawn by Vega-Lite in the browser, no matplotlib render needed)
+        st.bar_chart(
+            wrecks_per_year.set_index("Year")["Count"],
+            x_label="Year",
+            y_label="Number of Wrecks",
+        )
 
     st.markdown("---")
 
@@ -166,14 +335,15 @@ def main():
     # ===========================
     st.subheader("Main Causes of Shipwrecks")
 
-    if filtered_df.empty:
+    if match_count == 0:
         st.write("No data available.")
     else:
-        # #[PIVOTTABLE]  pivot table by Cause
+        # Frequency table by Cause; value_counts already sorts by count, and
+        # on a categorical it also lists unused causes, so drop the zeros
         cause_pivot = (
-            filtered_df.pivot_table(index="Cause", values="Year", aggfunc="count")
-            .rename(columns={"Year": "Count"})
-            .sort_values("Count", ascending=False)
+            cause_counts[cause_counts > 0]
+            .rename_axis("Cause")
+            .to_frame("Count")
         )
 
         # Show full table
@@ -189,27 +359,25 @@ def main():
     # ===========================
     st.subheader("Shipwreck Locations")
 
-    if filtered_df.empty:
+    if match_count == 0:
         st.write("No data available.")
     else:
-        # Drop rows without coordinates
-        map_df = filtered_df.dropna(subset=["Latitude", "Longitude"]).copy()
-
-        # Make sure lat/long are numeric and valid
-        map_df["Latitude"] = pd.to_numeric(map_df["Latitude"], errors="coerce")
-        map_df["Longitude"] = pd.to_numeric(map_df["Longitude"], errors="coerce")
-        map_df = map_df.dropna(subset=["Latitude", "Longitude"])
-        map_df = map_df[
-            (map_df["Latitude"].between(-90, 90))
-            & (map_df["Longitude"].between(-180, 180))
-        ]
-
+        # map_df holds only the coordinates, and only rows where they are
+        # valid (the ValidCoord column from load_data)
         if map_df.empty:
             st.write("No valid numeric coordinates available.")
         else:
+            if len(map_df) > MAX_MAP_POINTS:
+                st.write(
+                    f"Showing a random sample of {MAX_MAP_POINTS:,} "
+                    f"of {len(map_df):,} locations."
+                )
+                map_df = map_df.sample(MAX_MAP_POINTS, random_state=0)
+
             # Streamlit expects the columns to be called 'lat' and 'lon'
             map_df = map_df.rename(columns={"Latitude": "lat", "Longitude": "lon"})
-            st.map(map_df[["lat", "lon"]])
+            # st.map can't JSON-encode a float32 center point, so upcast here
+            st.map(map_df.astype(np.float64))
 
     st.markdown("---")
 
@@ -218,29 +386,26 @@ def main():
     # ===========================
     st.subheader("Fatal vs Non-Fatal Wrecks")
 
-    if filtered_df.empty:
+    if match_count == 0:
         st.write("No data available.")
     else:
-        fatal_counts = (
-            filtered_df["Fatal"]
-            .value_counts()
-            .rename_axis("Fatal")
-            .reset_index(name="Count")
-        )
-        fatal_counts["Label"] = fatal_counts["Fatal"].map(
-            {True: "Fatal", False: "Non-Fatal"}
-        )
+        fatal_counts = {"Fatal": fatal_total, "Non-Fatal": match_count - fatal_total}
+
+        # #[LISTCOMP]  list comprehension to leave out empty slices
+        slices = [(label, count) for label, count in fatal_counts.items() if count > 0]
 
         # #[CHART2] Pie chart showing Fatal vs nonfatal
-        fig3, ax3 = plt.subplots()
-        ax3.pie(
-            fatal_counts["Count"],
-            labels=fatal_counts["Label"],
-            autopct="%1.1f%%",
-            startangle=90,
-        )
-        ax3.set_title("Fatal vs Non-Fatal Wrecks")
-        st.pyplot(fig3)
+        fig3, ax3, fig3_lock = _get_fig("pie")
+        with fig3_lock:
+            ax3.clear()
+            ax3.pie(
+                [count for _, count in slices],
+                labels=[label for label, _ in slices],
+                autopct="%1.1f%%",
+                startangle=90,
+            )
+            ax3.set_title("Fatal vs Non-Fatal Wrecks")
+            st.pyplot(fig3)
 
 
 if __name__ == "__main__":